@@ -0,0 +1,329 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Condition
+from dotenv import load_dotenv
+from app.profiler import span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# weight: share of the call and token budget when classes compete
+# slo: longest queue time (seconds) a call may wait before being rejected, None to never reject
+PRIORITY_CLASSES = {
+    "interactive": {"weight": 6, "slo": None},
+    "api": {"weight": 3, "slo": 180},
+    "background": {"weight": 1, "slo": 600},
+}
+DEFAULT_PRIORITY = "api"
+
+_current_priority = ContextVar("admission_priority", default=DEFAULT_PRIORITY)
+_current_request = ContextVar("admission_request", default=None)
+
+
+@contextmanager
+def priority(name):
+    """
+    Run OpenAI calls in this block (or decorated sync function) under a priority class.
+    Async views should use it as a `with` block, since decorating a coroutine
+    function would exit before the coroutine runs.
+    """
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {name}")
+    token = _current_priority.set(name)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call would miss its priority class's queue-time SLO."""
+
+    def __init__(self, priority_class, wait):
+        self.priority_class = priority_class
+        self.wait = wait
+        super().__init__(
+            f"Server busy: {priority_class} request would wait ~{wait:.0f}s for an OpenAI slot. Try again later."
+        )
+
+
+class _RequestBudget:
+    """Expected OpenAI cost of a whole request, checked against the SLO once before its first call."""
+    def __init__(self, token_costs):
+        self.token_costs = list(token_costs)
+        self.checked = False
+        self.rejected = None
+
+
+class _Ticket:
+    def __init__(self, tokens, enforce_slo, loop=None):
+        self.tokens = tokens
+        self.enforce_slo = enforce_slo
+        self.enqueued_at = time.time()
+        # Async waiters are woken through their event loop instead of the Condition
+        self.loop = loop
+        self.wake = asyncio.Event() if loop else None
+
+
+class _PriorityClass:
+    def __init__(self, name, weight, slo):
+        self.name = name
+        self.weight = weight
+        self.slo = slo
+        self.queue = deque()
+        self.virtual_time = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.waits = deque(maxlen=100)  # recent queue times, seconds
+
+
+class AdmissionController:
+    """
+    Replaces the FIFO rate limiter with weighted fair queuing across priority
+    classes. Each OpenAI call costs one call slot and its max_tokens from the
+    token bucket; when classes compete, the class with the lowest weighted
+    usage goes next, so interactive calls overtake queued background work.
+    Threads wait in admit() and coroutines in aadmit(), on the same queues.
+    """
+    def __init__(self, calls_per_minute=20, tokens_per_minute=40000, classes=None):
+        self.calls_per_minute = calls_per_minute
+        self.interval = 60.0 / calls_per_minute  # seconds between calls
+        self.tokens_per_minute = tokens_per_minute
+        self.token_rate = tokens_per_minute / 60.0  # tokens refilled per second
+        self.classes = {
+            name: _PriorityClass(name, c["weight"], c["slo"])
+            for name, c in (classes or PRIORITY_CLASSES).items()
+        }
+        self.last_call_time = 0
+        self.virtual_clock = 0.0  # virtual time of the most recently admitted call
+        self.tokens_available = float(tokens_per_minute)
+        self.tokens_updated_at = time.time()
+        self.cond = Condition()
+
+    @contextmanager
+    def request(self, token_costs):
+        """
+        Declare the OpenAI calls (max_tokens of each) a request expects to make.
+        The SLO is checked once for the whole request at its first call, and
+        later calls are never rejected, so admitted work isn't thrown away midway.
+        """
+        token = _current_request.set(_RequestBudget(token_costs))
+        try:
+            yield
+        finally:
+            _current_request.reset(token)
+
+    def _refill_tokens(self, now):
+        elapsed = now - self.tokens_updated_at
+        self.tokens_available = min(self.tokens_per_minute, self.tokens_available + elapsed * self.token_rate)
+        self.tokens_updated_at = now
+
+    def _budget_wait(self, tokens, now):
+        """Seconds until both a call slot and `tokens` tokens are available."""
+        call_wait = self.last_call_time + self.interval - now
+        token_wait = (tokens - self.tokens_available) / self.token_rate
+        return max(0.0, call_wait, token_wait)
+
+    def _next_class(self):
+        active = [c for c in self.classes.values() if c.queue]
+        return min(active, key=lambda c: c.virtual_time) if active else None
+
+    def _estimate_wait(self, cls, tokens, now, extra_calls=0):
+        """
+        Rough queue time for a new call: the work fair sharing would serve before it,
+        plus `extra_calls` follow-up calls of the same request.
+        """
+        ahead_calls = len(cls.queue) + extra_calls
+        ahead_tokens = sum(t.tokens for t in cls.queue)
+        for other in self.classes.values():
+            if other is cls or not other.queue:
+                continue
+            # While both are queued, `other` is served weight-proportionally to `cls`
+            share = (len(cls.queue) + extra_calls + 1) * other.weight / cls.weight
+            served = min(len(other.queue), int(share + 0.999))
+            ahead_calls += served
+            ahead_tokens += sum(t.tokens for t in list(other.queue)[:served])
+        return max(
+            self._budget_wait(tokens, now) + ahead_calls * self.interval,
+            (ahead_tokens + tokens - self.tokens_available) / self.token_rate,
+        )
+
+    def _reject(self, cls, wait):
+        cls.rejected += 1
+        logger.warning(f"Admission: rejecting {cls.name} call, queue time ~{wait:.1f}s exceeds SLO {cls.slo}s")
+        raise AdmissionRejected(cls.name, wait)
+
+    def _notify(self):
+        """Wake every waiter, sync or async, to re-check whether it is next. Call with self.cond held."""
+        self.cond.notify_all()
+        for cls in self.classes.values():
+            for ticket in cls.queue:
+                if ticket.loop:
+                    ticket.loop.call_soon_threadsafe(ticket.wake.set)
+
+    def _enqueue(self, cls, tokens, loop=None):
+        """SLO-check and queue a call. Call with self.cond held."""
+        now = time.time()
+        self._refill_tokens(now)
+        enforce_slo = cls.slo is not None
+        budget = _current_request.get()
+        if enforce_slo and budget is not None:
+            if budget.rejected:
+                raise budget.rejected
+            if budget.checked:
+                # The request already passed its SLO check; don't strand work already paid for
+                enforce_slo = False
+            else:
+                total = max(sum(budget.token_costs), tokens)
+                estimate = self._estimate_wait(cls, total, now, extra_calls=max(0, len(budget.token_costs) - 1))
+                if estimate > cls.slo:
+                    try:
+                        self._reject(cls, estimate)
+                    except AdmissionRejected as e:
+                        budget.rejected = e
+                        raise
+                budget.checked = True
+                enforce_slo = False
+        if enforce_slo:
+            estimate = self._estimate_wait(cls, tokens, now)
+            if estimate > cls.slo:
+                self._reject(cls, estimate)
+        if not cls.queue:
+            # A class returning from idle doesn't get credit for the time it was away
+            cls.virtual_time = max(cls.virtual_time, self.virtual_clock)
+        ticket = _Ticket(tokens, enforce_slo, loop)
+        cls.queue.append(ticket)
+        # Wake waiters so a higher-priority arrival can overtake them
+        self._notify()
+        return ticket
+
+    def _poll(self, cls, ticket):
+        """
+        Admit the ticket if it is next and the budget allows, returning None.
+        Otherwise return how long to wait before polling again (None for
+        until notified). Call with self.cond held.
+        """
+        now = time.time()
+        self._refill_tokens(now)
+        waited = now - ticket.enqueued_at
+        if ticket.enforce_slo and waited > cls.slo:
+            self._dequeue(cls, ticket)
+            self._reject(cls, waited)
+        timeout = cls.slo - waited if ticket.enforce_slo else None
+        if self._next_class() is cls and cls.queue[0] is ticket:
+            budget_wait = self._budget_wait(ticket.tokens, now)
+            if budget_wait <= 0:
+                self._grant(cls, ticket, now)
+                return None
+            timeout = budget_wait if timeout is None else min(timeout, budget_wait)
+        return timeout if timeout is not None else -1
+
+    def _dequeue(self, cls, ticket):
+        cls.queue.remove(ticket)
+        self._notify()
+
+    def _grant(self, cls, ticket, now):
+        cls.queue.popleft()
+        self.last_call_time = now
+        self.tokens_available -= ticket.tokens
+        self.virtual_clock = cls.virtual_time
+        cls.virtual_time += ticket.tokens / cls.weight
+        cls.admitted += 1
+        wait = now - ticket.enqueued_at
+        cls.waits.append(wait)
+        self._notify()
+        if wait > 1:
+            logger.info(f"Admission: {cls.name} call waited {wait:.2f} seconds")
+
+    def admit(self, tokens, priority_class=None):
+        """
+        Block until this call may go to OpenAI, or raise AdmissionRejected if
+        its class has an SLO that the queue time would miss.
+        """
+        name = priority_class or current_priority()
+        cls = self.classes[name]
+        tokens = min(tokens, self.tokens_per_minute)
+        with span(f"admission.wait:{name}"), self.cond:
+            ticket = self._enqueue(cls, tokens)
+            while True:
+                timeout = self._poll(cls, ticket)
+                if timeout is None:
+                    return
+                self.cond.wait(timeout=timeout if timeout >= 0 else None)
+
+    async def aadmit(self, tokens, priority_class=None):
+        """Async version of admit(): waits on the event loop instead of blocking a thread."""
+        name = priority_class or current_priority()
+        cls = self.classes[name]
+        tokens = min(tokens, self.tokens_per_minute)
+        with span(f"admission.wait:{name}"):
+            with self.cond:
+                ticket = self._enqueue(cls, tokens, loop=asyncio.get_running_loop())
+            try:
+                while True:
+                    with self.cond:
+                        # Cleared under the lock so a wake-up sent after this poll isn't lost
+                        ticket.wake.clear()
+                        timeout = self._poll(cls, ticket)
+                    if timeout is None:
+                        return
+                    try:
+                        await asyncio.wait_for(ticket.wake.wait(), timeout=timeout if timeout >= 0 else None)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                with self.cond:
+                    if ticket in cls.queue:
+                        self._dequeue(cls, ticket)
+                raise
+
+    def stats(self):
+        """Queue depth and recent wait times per priority class."""
+        with self.cond:
+            return {
+                name: {
+                    "queue_depth": len(cls.queue),
+                    "admitted": cls.admitted,
+                    "rejected": cls.rejected,
+                    "avg_wait": round(sum(cls.waits) / len(cls.waits), 2) if cls.waits else 0.0,
+                    "max_wait": round(max(cls.waits), 2) if cls.waits else 0.0,
+                }
+                for name, cls in self.classes.items()
+            }
+
+
+def _env_number(name, default):
+    # A bad value shouldn't stop the app from starting
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        logger.warning(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+    return number
+
+
+# Budgets are per process. When run.py and asgi.py both serve traffic, give each a
+# share of the account's limits so together they stay within them.
+ADMISSION_CALLS_PER_MINUTE = _env_number("ADMISSION_CALLS_PER_MINUTE", 1)  # 1 call per minute is very conservative
+ADMISSION_TOKENS_PER_MINUTE = _env_number("ADMISSION_TOKENS_PER_MINUTE", 40000)
+
+# Create a global admission controller shared by all OpenAI calls in this process, sync and async
+admission_controller = AdmissionController(
+    calls_per_minute=ADMISSION_CALLS_PER_MINUTE,
+    tokens_per_minute=ADMISSION_TOKENS_PER_MINUTE
+)
@@ -3,12 +3,15 @@ import time
 import random
 import functools
 import re  # Add this for regex pattern matching
+import json
 from dotenv import load_dotenv
 from openai import OpenAI, RateLimitError
 import logging
-from threading import Lock
 from flask import current_app
 from seo_fetcher import get_search_volume, get_avg_cpc, get_keyword_difficulty  # Import the mock data loader
+from app.model_router import model_router
+from app.profiler import span, profiled
+from app.admission import admission_controller
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -22,16 +25,18 @@ DEVELOPMENT_MODE = False
 _cache = {}
 
 def cache_set(cache, key, value, timeout=None):
-    if hasattr(cache, "set"):
-        cache.set(key, value, timeout=timeout)
-    else:
-        cache[key] = value
+    with span(f"cache.set:{key.split(':')[0]}"):
+        if hasattr(cache, "set"):
+            cache.set(key, value, timeout=timeout)
+        else:
+            cache[key] = value
 
 def cache_get(cache, key):
-    if hasattr(cache, "get"):
-        return cache.get(key)
-    else:
-        return cache.get(key)
+    with span(f"cache.get:{key.split(':')[0]}"):
+        if hasattr(cache, "get"):
+            return cache.get(key)
+        else:
+            return cache.get(key)
 
 
 def cached(func):
@@ -139,29 +144,6 @@ if not api_key_valid:
 # Add debug print to verify this value is being used
 print(f"DEVELOPMENT_MODE is set to: {DEVELOPMENT_MODE}")
 
-# Rate limiting implementation
-class RateLimiter:
-    def __init__(self, calls_per_minute=20):
-        self.calls_per_minute = calls_per_minute
-        self.interval = 60.0 / calls_per_minute  # seconds between calls
-        self.last_call_time = 0
-        self.lock = Lock()
-    
-    def wait_if_needed(self):
-        with self.lock:
-            current_time = time.time()
-            time_since_last_call = current_time - self.last_call_time
-            
-            if time_since_last_call < self.interval:
-                sleep_time = self.interval - time_since_last_call
-                logger.info(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-                time.sleep(sleep_time)
-            
-            self.last_call_time = time.time()
-
-# Create a global rate limiter (1 call per 2 minutes is very conservative)
-rate_limiter = RateLimiter(calls_per_minute=1)
-
 # Modify the OpenAI client creation to use rate limiting
 def get_openai_client():
     load_dotenv()
@@ -173,6 +155,128 @@ def get_openai_client():
     
     return OpenAI(api_key=api_key)
 
+# max_tokens per generation stage, used by the request builders below and for admission budgets
+STAGE_MAX_TOKENS = {
+    "title": 30,
+    "post": 700,
+    "batch": 500,
+    "seo": 100,
+}
+
+def stage_costs(*stages):
+    """Token costs of the OpenAI calls a request will make, for admission_controller.request()."""
+    return [STAGE_MAX_TOKENS[stage] for stage in stages]
+
+# Request builders and parsers shared by the sync generators below and the async ones in async_ai_generator.py
+def build_title_request(topic):
+    prompt = f"Create a short, catchy title for a blog about {topic}"
+    return {
+        "messages": [
+            {"role": "system", "content": "You create short, catchy blog titles."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": STAGE_MAX_TOKENS["title"],
+        "temperature": 0.7,
+    }
+
+def mock_blog_title(topic):
+    return f"The Complete Guide to {topic}: Everything You Need to Know"
+
+def build_post_request(topic, keywords):
+    prompt = (
+        f"Write a blog post about '{topic}' with the following structure:\n"
+        "- Introduction\n"
+        "- Main Content (with at least two sections)\n"
+        "- Conclusion\n"
+        "At the end, include a section titled 'Recommended Products' with 2-3 dummy affiliate links (e.g., https://affiliate.example.com/product1).\n"
+        f"Include these keywords: {', '.join(keywords)}."
+    )
+    return {
+        "messages": [
+            {"role": "system", "content": "You are a concise blog writer. Follow the structure and include affiliate links as instructed."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": STAGE_MAX_TOKENS["post"],
+        "temperature": 0.7,
+    }
+
+def mock_blog_post(topic, keywords):
+    return (
+        f"<h2>Introduction</h2>"
+        f"<p>This is a development mode blog post about {topic}. It discusses various aspects of {topic} and how it relates to {', '.join(keywords)}.</p>"
+        f"<h2>Main Content</h2>"
+        f"<p>Section 1: ...</p><p>Section 2: ...</p>"
+        f"<h2>Conclusion</h2>"
+        f"<p>Summary and final thoughts on {topic}.</p>"
+        f"<div class='affiliate'><h2>Recommended Products</h2><ul>"
+        f"<li><a href='https://affiliate.example.com/product1' target='_blank'>Product 1</a></li>"
+        f"<li><a href='https://affiliate.example.com/product2' target='_blank'>Product 2</a></li>"
+        f"<li><a href='https://affiliate.example.com/product3' target='_blank'>Product 3</a></li>"
+        f"</ul></div>"
+    )
+
+def build_batch_request(topic, keywords):
+    prompt = f"""
+    Create a blog post about {topic}. Include these keywords: {', '.join(keywords)}.
+    Format your response as:
+    TITLE: [Your catchy title here]
+    
+    CONTENT: [Your blog post content here]
+    """
+    return {
+        "messages": [
+            {"role": "system", "content": "You are a concise blog writer. Keep responses under 300 words."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": STAGE_MAX_TOKENS["batch"],
+        "temperature": 0.7,
+    }
+
+def mock_content_batch(topic, keywords):
+    return {
+        "title": f"The Complete Guide to {topic}",
+        "content": f"This is a development mode blog post about {topic}. It discusses various aspects of {topic} and how it relates to {', '.join(keywords)}."
+    }
+
+def parse_content_batch(full_text, topic):
+    # Parse the response to extract title and content
+    title_match = re.search(r"TITLE:\s*(.*?)(?:\n\n|\n|$)", full_text)
+    content_match = re.search(r"CONTENT:\s*(.*)", full_text, re.DOTALL)
+    
+    title = title_match.group(1) if title_match else f"Blog about {topic}"
+    content = content_match.group(1) if content_match else full_text
+    
+    return {
+        "title": title.strip(),
+        "content": content.strip()
+    }
+
+def build_seo_request(keyword):
+    prompt = (
+        f"Estimate plausible SEO metrics for the keyword '{keyword}'. "
+        "Respond in JSON with keys: search_volume (int), avg_cpc (float, USD), keyword_difficulty (0-100 int)."
+    )
+    return {
+        "messages": [
+            {"role": "system", "content": "You are an SEO expert."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": STAGE_MAX_TOKENS["seo"],
+        "temperature": 0.7,
+    }
+
+def parse_seo_metrics(text, keyword):
+    try:
+        return json.loads(text)
+    except Exception:
+        # fallback: use mock functions for this keyword
+        return {
+            "search_volume": get_search_volume(keyword),
+            "avg_cpc": get_avg_cpc(keyword),
+            "keyword_difficulty": get_keyword_difficulty(keyword)
+        }
+
+@profiled()
 def generate_blog_title(topic):
     cache = current_app.extensions.get('cache', _cache)  # fallback to dict if needed
     cache_key = f"title:{topic}"
@@ -182,29 +286,20 @@ def generate_blog_title(topic):
     
     if DEVELOPMENT_MODE:
         logger.info(f"DEVELOPMENT MODE: Generating mock blog title for {topic}")
-        title = f"The Complete Guide to {topic}: Everything You Need to Know"
+        title = mock_blog_title(topic)
     else:
-        # Apply rate limiting before making the API call
-        rate_limiter.wait_if_needed()
+        # Wait for an OpenAI slot under the caller's priority class
+        request_kwargs = build_title_request(topic)
+        admission_controller.admit(request_kwargs["max_tokens"])
         
         client = get_openai_client()
-        prompt = f"Create a short, catchy title for a blog about {topic}"
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You create short, catchy blog titles."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=30,
-            temperature=0.7,
-        )
-        
+        response = model_router.complete(client, "title", **request_kwargs)
         title = response.choices[0].message.content
     
     cache_set(cache, cache_key, title, timeout=60*60*24)
     return title
 
+@profiled()
 def generate_blog_post(topic, keywords):
     cache = current_app.extensions.get('cache', _cache)  # fallback to dict if needed
     cache_key = f"post:{topic}:{','.join(keywords)}"
@@ -214,87 +309,32 @@ def generate_blog_post(topic, keywords):
 
     if DEVELOPMENT_MODE:
         logger.info(f"DEVELOPMENT MODE: Generating mock blog post for {topic}")
-        post = (
-            f"<h2>Introduction</h2>"
-            f"<p>This is a development mode blog post about {topic}. It discusses various aspects of {topic} and how it relates to {', '.join(keywords)}.</p>"
-            f"<h2>Main Content</h2>"
-            f"<p>Section 1: ...</p><p>Section 2: ...</p>"
-            f"<h2>Conclusion</h2>"
-            f"<p>Summary and final thoughts on {topic}.</p>"
-            f"<div class='affiliate'><h2>Recommended Products</h2><ul>"
-            f"<li><a href='https://affiliate.example.com/product1' target='_blank'>Product 1</a></li>"
-            f"<li><a href='https://affiliate.example.com/product2' target='_blank'>Product 2</a></li>"
-            f"<li><a href='https://affiliate.example.com/product3' target='_blank'>Product 3</a></li>"
-            f"</ul></div>"
-        )
+        post = mock_blog_post(topic, keywords)
     else:
         logger.info(f"PRODUCTION MODE: Making API call to generate blog post for {topic}")
-        rate_limiter.wait_if_needed()
+        request_kwargs = build_post_request(topic, keywords)
+        admission_controller.admit(request_kwargs["max_tokens"])
         client = get_openai_client()
-        prompt = (
-            f"Write a blog post about '{topic}' with the following structure:\n"
-            "- Introduction\n"
-            "- Main Content (with at least two sections)\n"
-            "- Conclusion\n"
-            "At the end, include a section titled 'Recommended Products' with 2-3 dummy affiliate links (e.g., https://affiliate.example.com/product1).\n"
-            f"Include these keywords: {', '.join(keywords)}."
-        )
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a concise blog writer. Follow the structure and include affiliate links as instructed."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=700,
-            temperature=0.7,
-        )
+        response = model_router.complete(client, "post", **request_kwargs)
         post = response.choices[0].message.content
 
     cache_set(cache, cache_key, post, timeout=60*60*24)
     return post
 
+@profiled()
 def generate_content_batch(topic, keywords):
     if DEVELOPMENT_MODE:
-        return {
-            "title": f"The Complete Guide to {topic}",
-            "content": f"This is a development mode blog post about {topic}. It discusses various aspects of {topic} and how it relates to {', '.join(keywords)}."
-        }
+        return mock_content_batch(topic, keywords)
     
-    # Apply rate limiting before making the API call
-    rate_limiter.wait_if_needed()
+    # Wait for an OpenAI slot under the caller's priority class
+    request_kwargs = build_batch_request(topic, keywords)
+    admission_controller.admit(request_kwargs["max_tokens"])
     
     client = get_openai_client()
-    prompt = f"""
-    Create a blog post about {topic}. Include these keywords: {', '.join(keywords)}.
-    Format your response as:
-    TITLE: [Your catchy title here]
-    
-    CONTENT: [Your blog post content here]
-    """
-    
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a concise blog writer. Keep responses under 300 words."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=500,
-        temperature=0.7,
-    )
-    
-    # Parse the response to extract title and content
-    full_text = response.choices[0].message.content
-    title_match = re.search(r"TITLE:\s*(.*?)(?:\n\n|\n|$)", full_text)
-    content_match = re.search(r"CONTENT:\s*(.*)", full_text, re.DOTALL)
-    
-    title = title_match.group(1) if title_match else f"Blog about {topic}"
-    content = content_match.group(1) if content_match else full_text
-    
-    return {
-        "title": title.strip(),
-        "content": content.strip()
-    }
+    response = model_router.complete(client, "batch", **request_kwargs)
+    return parse_content_batch(response.choices[0].message.content, topic)
 
+@profiled()
 def generate_seo_metrics(keyword):
     """
     Use OpenAI to generate plausible SEO metrics for a keyword.
@@ -306,30 +346,10 @@ def generate_seo_metrics(keyword):
     if cached:
         return cached
 
-    prompt = (
-        f"Estimate plausible SEO metrics for the keyword '{keyword}'. "
-        "Respond in JSON with keys: search_volume (int), avg_cpc (float, USD), keyword_difficulty (0-100 int)."
-    )
-
+    request_kwargs = build_seo_request(keyword)
+    admission_controller.admit(request_kwargs["max_tokens"])
     client = get_openai_client()
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are an SEO expert."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=100,
-        temperature=0.7,
-    )
-    import json
-    try:
-        metrics = json.loads(response.choices[0].message.content)
-    except Exception:
-        # fallback: use mock functions for this keyword
-        metrics = {
-            "search_volume": get_search_volume(keyword),
-            "avg_cpc": get_avg_cpc(keyword),
-            "keyword_difficulty": get_keyword_difficulty(keyword)
-        }
+    response = model_router.complete(client, "seo", **request_kwargs)
+    metrics = parse_seo_metrics(response.choices[0].message.content, keyword)
     cache_set(cache, cache_key, metrics, timeout=60*60*24)
     return metrics
@@ -2,9 +2,8 @@
 import os
 import atexit
 import sys
-import re
 import random
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Flask, jsonify, request, render_template_string
 from apscheduler.schedulers.background import BackgroundScheduler
 from functools import lru_cache
@@ -18,125 +17,69 @@ from app.ai_generator import (
     generate_blog_title,
     DEVELOPMENT_MODE,
     generate_content_batch,
-    generate_seo_metrics
+    generate_seo_metrics,
+    stage_costs
 )
 from app.seo_fetcher import get_search_volume, get_avg_cpc, get_keyword_difficulty
+from app import profiler
+from app.admission import admission_controller, priority, AdmissionRejected
+from app.rendering import BASE_TEMPLATE, blog_content_html, save_blog_html, slow_requests_html
+from app.scheduling import PREDEFINED_KEYWORDS, SCHEDULED_JOB_DEFER_MINUTES, SCHEDULER_PROCESS
 
 # Print development mode status at app startup
 print(f"App starting with DEVELOPMENT_MODE = {DEVELOPMENT_MODE}")
 
-PREDEFINED_KEYWORDS = [
-    "wireless earbuds",
-    "smart home devices",
-    "AI in healthcare",
-    "electric vehicles",
-    "blockchain technology",
-    "remote work tools",
-    "fitness trackers",
-    "sustainable fashion",
-    "cloud computing",
-    "virtual reality"
-]
-
 app = Flask(__name__)
 cache = Cache(app, config={'CACHE_TYPE': 'filesystem', 'CACHE_DIR': 'flask_cache'})
 limiter = Limiter(get_remote_address, app=app, default_limits=["60 per hour"])
-
-# Base HTML template for consistent styling
-BASE_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>{{ title }}</title>
-    <style>
-        body { font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto; padding: 20px; }
-        h1 { color: #333; }
-        .metrics { background: #f5f5f5; padding: 15px; border-radius: 5px; margin-top: 20px; }
-        .error { color: red; }
-        nav { margin-bottom: 20px; }
-        nav a { margin-right: 15px; }
-        .affiliate { margin-top: 30px; background: #e8f4fd; padding: 15px; border-radius: 5px; }
-    </style>
-</head>
-<body>
-    <nav>
-        <a href="/">Home</a>
-        <a href="/about">About</a>
-        <a href="/generate?keyword=AI">Generate Blog</a>
-    </nav>
-    <div class="content">
-        {{ content | safe }}
-    </div>
-</body>
-</html>
-"""
+profiler.init_app(app)
 
 # Define blog storage directory
 BLOG_DIR = os.path.join(os.getcwd(), 'blogs')
 os.makedirs(BLOG_DIR, exist_ok=True)
 
-def safe_filename(keyword):
-    # Only allow alphanumeric, dash, and underscore
-    return re.sub(r'[^a-zA-Z0-9_-]', '_', keyword)
-
 # --- Blog Generation and Saving ---
 
+@profiler.profiled("render")
 def render_blog_html(title, content, metrics=None):
-    # Add affiliate links at the bottom
-    affiliate_html = """
-    <div class="affiliate">
-        <h2>Recommended Products</h2>
-        <ul>
-            <li><a href="https://affiliate.example.com/product1" target="_blank">Product 1</a></li>
-            <li><a href="https://affiliate.example.com/product2" target="_blank">Product 2</a></li>
-            <li><a href="https://affiliate.example.com/product3" target="_blank">Product 3</a></li>
-        </ul>
-    </div>
-    """
-    metrics_html = ""
-    if metrics:
-        metrics_html = f"""
-        <div class="metrics">
-            <h2>SEO Metrics</h2>
-            <p>Search Volume: {metrics.get('search_volume')}</p>
-            <p>Avg CPC: ${metrics.get('avg_cpc')}</p>
-            <p>Keyword Difficulty: {metrics.get('keyword_difficulty')}/100</p>
-        </div>
-        """
     return render_template_string(
         BASE_TEMPLATE,
         title=title,
-        content=f"<h1>{title}</h1><p>{content}</p>{metrics_html}{affiliate_html}"
+        content=blog_content_html(title, content, metrics)
     )
 
-def save_blog_html(html_output, topic, mode="manual"):
-    safe_name = safe_filename(topic)
-    save_dir = os.path.join("saved_blogs", mode)
-    os.makedirs(save_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = os.path.join(save_dir, f"blog_{mode}_{safe_name}_{timestamp}.html")
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html_output)
-    print(f"Blog saved to {filename}")
-    return filename
-
 def generate_and_save(topic, keywords):
     try:
-        content = generate_content_batch(topic, keywords)
-        metrics = generate_seo_metrics(topic)
+        # Checked against the SLO as a whole, so the seo call can't be rejected after the content is generated
+        with admission_controller.request(stage_costs("batch", "seo")):
+            content = generate_content_batch(topic, keywords)
+            metrics = generate_seo_metrics(topic)
         html_output = render_blog_html(content["title"], content["content"], metrics)
         return save_blog_html(html_output, topic, mode="scheduled")
+    except AdmissionRejected:
+        # Let the scheduler decide whether to retry later
+        raise
     except Exception as e:
         print(f"Error in scheduled task: {e}")
         return None
 
 # --- Scheduler Setup ---
-if not DEVELOPMENT_MODE:
+# Skipped when SCHEDULER_PROCESS=asgi, in which case asgi.py runs the job instead
+if not DEVELOPMENT_MODE and SCHEDULER_PROCESS == "flask":
     scheduler = BackgroundScheduler()
-    def scheduled_job():
-        with app.app_context():
-            topic = random.choice(PREDEFINED_KEYWORDS)
-            generate_and_save(topic, [topic])
+    def scheduled_job(topic=None):
+        with app.app_context(), priority("background"):
+            topic = topic or random.choice(PREDEFINED_KEYWORDS)
+            try:
+                generate_and_save(topic, [topic])
+            except AdmissionRejected as e:
+                print(f"Scheduled task for {topic} deferred {SCHEDULED_JOB_DEFER_MINUTES} minutes: {e}")
+                scheduler.add_job(
+                    scheduled_job,
+                    'date',
+                    run_date=datetime.now() + timedelta(minutes=SCHEDULED_JOB_DEFER_MINUTES),
+                    args=[topic]
+                )
     scheduler.add_job(
         scheduled_job,
         'cron',
@@ -149,6 +92,7 @@ if not DEVELOPMENT_MODE:
 # --- Routes ---
 
 @app.route('/')
+@priority("interactive")
 def main():
     try:
         if DEVELOPMENT_MODE:
@@ -177,6 +121,7 @@ def about():
     return render_template_string(BASE_TEMPLATE, title="About", content=content)
 
 @app.route('/api/seo', methods=['GET'])
+@priority("api")
 def get_seo_data():
     try:
         keyword = request.args.get('keyword')
@@ -184,11 +129,14 @@ def get_seo_data():
             return jsonify({"error": "Keyword parameter is required"}), 400
         data = generate_seo_metrics(keyword)
         return jsonify(data)
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/generate', methods=['POST'])
 @limiter.limit("10 per hour")
+@priority("api")
 def generate_blog():
     try:
         data = request.get_json()
@@ -198,19 +146,24 @@ def generate_blog():
         if not topic:
             return jsonify({"error": "Topic is required"}), 400
         keywords = data.get('keywords', [topic])
-        blog_title = generate_blog_title(topic)
-        blog_post = generate_blog_post(topic, keywords)
-        metrics = generate_seo_metrics(topic)
+        # Checked against the SLO as a whole, so a request is never rejected halfway through
+        with admission_controller.request(stage_costs("title", "post", "seo")):
+            blog_title = generate_blog_title(topic)
+            blog_post = generate_blog_post(topic, keywords)
+            metrics = generate_seo_metrics(topic)
         return jsonify({
             'title': blog_title,
             'content': blog_post,
             'seo_metrics': metrics
         })
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/generate', methods=['GET'])
 @limiter.limit("10 per hour")
+@priority("interactive")
 def generate_blog_from_keyword():
     try:
         keyword = request.args.get('keyword', 'AI')
@@ -230,6 +183,7 @@ def generate_blog_from_keyword():
 @app.route('/debug')
 def debug_info():
     from app.ai_generator import DEVELOPMENT_MODE, check_api_key
+    from app.model_router import model_router
     api_key_valid = check_api_key()
     env_vars = {k: v for k, v in os.environ.items() if k.startswith('OPEN')}
     for k, v in env_vars.items():
@@ -247,9 +201,25 @@ def debug_info():
         <ul>
             {''.join([f'<li>{k}: {v}</li>' for k, v in env_vars.items()])}
         </ul>
+        <h2>Model Routes</h2>
+        <ul>
+            {''.join([f'<li>{stage}: {" -> ".join(models)}</li>' for stage, models in model_router.routes.items()])}
+        </ul>
+        <h2>Admission Queues</h2>
+        <ul>
+            {''.join([f'<li>{c}: {s}</li>' for c, s in admission_controller.stats().items()])}
+        </ul>
+        <h2>Model Health</h2>
+        <ul>
+            {''.join([f'<li>{m}: {s}</li>' for m, s in model_router.snapshot().items()])}
+        </ul>
     """
     return render_template_string(BASE_TEMPLATE, title="Debug Info", content=content)
 
+@app.route('/debug/profile')
+def debug_profile():
+    return render_template_string(BASE_TEMPLATE, title="Profile", content=slow_requests_html())
+
 @app.errorhandler(404)
 def page_not_found(e):
     content = """
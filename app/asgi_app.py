@@ -0,0 +1,146 @@
+# Async versions of the generation routes, served from an ASGI server.
+# Each in-flight generation is a coroutine awaiting AsyncOpenAI, not a blocked thread,
+# so one worker process can hold hundreds of concurrent LLM calls.
+import asyncio
+import random
+from datetime import datetime, timedelta
+from quart import Quart, jsonify, request, render_template_string
+from quart_rate_limiter import RateLimiter, rate_limit
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from app.rendering import BASE_TEMPLATE, blog_content_html, save_blog_html, slow_requests_html
+from app import profiler
+from app.admission import admission_controller, priority, AdmissionRejected
+from app.ai_generator import stage_costs, DEVELOPMENT_MODE
+from app.scheduling import PREDEFINED_KEYWORDS, SCHEDULED_JOB_DEFER_MINUTES, SCHEDULER_PROCESS
+from app.async_ai_generator import (
+    generate_blog_post,
+    generate_blog_title,
+    generate_content_batch,
+    generate_seo_metrics
+)
+
+asgi_app = Quart(__name__)
+RateLimiter(asgi_app)
+profiler.init_quart_app(asgi_app)
+
+# --- Scheduler Setup ---
+# Only when SCHEDULER_PROCESS=asgi, so the scheduled post queues on the same admission
+# budget as this app's traffic. Run a single worker, or every worker schedules its own post.
+scheduler = AsyncIOScheduler()
+
+async def scheduled_job(topic=None):
+    topic = topic or random.choice(PREDEFINED_KEYWORDS)
+    try:
+        # Checked against the SLO as a whole, so the seo call can't be rejected after the content is generated
+        with priority("background"), admission_controller.request(stage_costs("batch", "seo")):
+            content, metrics = await asyncio.gather(
+                generate_content_batch(topic, [topic]),
+                generate_seo_metrics(topic)
+            )
+        async with asgi_app.app_context():
+            html_output = await render_template_string(
+                BASE_TEMPLATE,
+                title=content["title"],
+                content=blog_content_html(content["title"], content["content"], metrics)
+            )
+        await asyncio.to_thread(save_blog_html, html_output, topic, mode="scheduled")
+    except AdmissionRejected as e:
+        print(f"Scheduled task for {topic} deferred {SCHEDULED_JOB_DEFER_MINUTES} minutes: {e}")
+        scheduler.add_job(
+            scheduled_job,
+            'date',
+            run_date=datetime.now() + timedelta(minutes=SCHEDULED_JOB_DEFER_MINUTES),
+            args=[topic]
+        )
+    except Exception as e:
+        print(f"Error in scheduled task: {e}")
+
+@asgi_app.before_serving
+async def start_scheduler():
+    if not DEVELOPMENT_MODE and SCHEDULER_PROCESS == "asgi":
+        scheduler.add_job(
+            scheduled_job,
+            'cron',
+            hour=0,
+            minute=0
+        )
+        scheduler.start()
+
+@asgi_app.after_serving
+async def stop_scheduler():
+    if scheduler.running:
+        scheduler.shutdown()
+
+@asgi_app.route('/api/seo', methods=['GET'])
+@rate_limit(60, timedelta(hours=1))  # Matches the Flask app's default limit
+async def get_seo_data():
+    try:
+        keyword = request.args.get('keyword')
+        if not keyword:
+            return jsonify({"error": "Keyword parameter is required"}), 400
+        with priority("api"):
+            data = await generate_seo_metrics(keyword)
+        return jsonify(data)
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@asgi_app.route('/api/generate', methods=['POST'])
+@rate_limit(10, timedelta(hours=1))
+async def generate_blog():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Request must include JSON data"}), 400
+        topic = data.get('topic')
+        if not topic:
+            return jsonify({"error": "Topic is required"}), 400
+        keywords = data.get('keywords', [topic])
+        # Checked against the SLO as a whole, so a request is never rejected halfway through
+        with priority("api"), admission_controller.request(stage_costs("title", "post", "seo")):
+            # The three calls are independent, so run them concurrently
+            blog_title, blog_post, metrics = await asyncio.gather(
+                generate_blog_title(topic),
+                generate_blog_post(topic, keywords),
+                generate_seo_metrics(topic)
+            )
+        return jsonify({
+            'title': blog_title,
+            'content': blog_post,
+            'seo_metrics': metrics
+        })
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@asgi_app.route('/generate', methods=['GET'])
+@rate_limit(10, timedelta(hours=1))
+async def generate_blog_from_keyword():
+    try:
+        keyword = request.args.get('keyword', 'AI')
+        with priority("interactive"):
+            content, metrics = await asyncio.gather(
+                generate_content_batch(keyword, [keyword]),
+                generate_seo_metrics(keyword)
+            )
+        html_output = await render_template_string(
+            BASE_TEMPLATE,
+            title=content["title"],
+            content=blog_content_html(content["title"], content["content"], metrics)
+        )
+        # Disk write goes to a worker thread so it doesn't block the event loop
+        await asyncio.to_thread(save_blog_html, html_output, keyword, mode="manual")
+        return jsonify({
+            "title": content["title"],
+            "content": content["content"],
+            "seo_metrics": metrics
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@asgi_app.route('/debug/profile')
+async def debug_profile():
+    return await render_template_string(BASE_TEMPLATE, title="Profile", content=slow_requests_html())
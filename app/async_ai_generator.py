@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import functools
+import logging
+from collections import OrderedDict
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from app import ai_generator
+from app.ai_generator import (
+    build_title_request,
+    mock_blog_title,
+    build_post_request,
+    mock_blog_post,
+    build_batch_request,
+    mock_content_batch,
+    parse_content_batch,
+    build_seo_request,
+    parse_seo_metrics,
+)
+from app.model_router import model_router
+from app.admission import admission_controller, current_priority, AdmissionRejected
+from app.profiler import span, profiled
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = 60*60*24
+
+
+class AsyncCache:
+    """
+    In-memory LRU cache with expiry. Concurrent misses for the same key share one
+    in-flight computation instead of each making its own OpenAI call.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.values = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self.pending = {}  # key -> asyncio.Task
+
+    def get(self, key):
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and time.time() >= expires_at:
+            del self.values[key]
+            return None
+        self.values.move_to_end(key)
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.time() + timeout if timeout else None
+        self.values[key] = (expires_at, value)
+        self.values.move_to_end(key)
+        while len(self.values) > self.max_entries:
+            self.values.popitem(last=False)
+
+    def _store(self, pending_key, timeout, task):
+        # Runs when the task finishes, even if every caller awaiting it was cancelled
+        self.pending.pop(pending_key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.set(pending_key[0], task.result(), timeout=timeout)
+
+    async def get_or_create(self, key, factory, timeout=None):
+        with span(f"cache.get:{key.split(':')[0]}"):
+            cached = self.get(key)
+        if cached:
+            return cached
+        # The in-flight call waits in the admission queue of the caller that started it,
+        # so only callers of the same priority class share it
+        pending_key = (key, current_priority())
+        task = self.pending.get(pending_key)
+        if task is not None and task.done():
+            # Finished but its done-callback hasn't cleared it yet
+            task = None
+        created = task is None
+        if created:
+            task = asyncio.ensure_future(factory())
+            self.pending[pending_key] = task
+            task.add_done_callback(functools.partial(self._store, pending_key, timeout))
+        else:
+            logger.info(f"Waiting on in-flight result for {key}")
+        try:
+            # Shield so a cancelled caller (e.g. a client disconnect) doesn't cancel the call for everyone else
+            return await asyncio.shield(task)
+        except AdmissionRejected:
+            if created:
+                raise
+        # The rejection was against the SLO or request budget of whoever started the call, not ours
+        logger.info(f"Shared call for {key} was rejected; retrying for this caller")
+        return await self.get_or_create(key, factory, timeout=timeout)
+
+
+async_cache = AsyncCache()
+_async_client = None
+
+
+def get_async_openai_client():
+    """Return a shared AsyncOpenAI client so all in-flight calls reuse one connection pool."""
+    global _async_client
+    if _async_client is None:
+        load_dotenv()
+        api_key = os.getenv("OPEN_API_KEY")
+        if not api_key:
+            logger.error("API key not found")
+            raise ValueError("API key not found. Set OPEN_API_KEY in your .env file")
+        _async_client = AsyncOpenAI(api_key=api_key)
+    return _async_client
+
+
+@profiled()
+async def generate_blog_title(topic):
+    async def create():
+        if ai_generator.DEVELOPMENT_MODE:
+            logger.info(f"DEVELOPMENT MODE: Generating mock blog title for {topic}")
+            return mock_blog_title(topic)
+        request_kwargs = build_title_request(topic)
+        await admission_controller.aadmit(request_kwargs["max_tokens"])
+        client = get_async_openai_client()
+        response = await model_router.acomplete(client, "title", **request_kwargs)
+        return response.choices[0].message.content
+
+    return await async_cache.get_or_create(f"title:{topic}", create, timeout=CACHE_TIMEOUT)
+
+
+@profiled()
+async def generate_blog_post(topic, keywords):
+    async def create():
+        if ai_generator.DEVELOPMENT_MODE:
+            logger.info(f"DEVELOPMENT MODE: Generating mock blog post for {topic}")
+            return mock_blog_post(topic, keywords)
+        logger.info(f"PRODUCTION MODE: Making API call to generate blog post for {topic}")
+        request_kwargs = build_post_request(topic, keywords)
+        await admission_controller.aadmit(request_kwargs["max_tokens"])
+        client = get_async_openai_client()
+        response = await model_router.acomplete(client, "post", **request_kwargs)
+        return response.choices[0].message.content
+
+    return await async_cache.get_or_create(f"post:{topic}:{','.join(keywords)}", create, timeout=CACHE_TIMEOUT)
+
+
+@profiled()
+async def generate_content_batch(topic, keywords):
+    if ai_generator.DEVELOPMENT_MODE:
+        return mock_content_batch(topic, keywords)
+    request_kwargs = build_batch_request(topic, keywords)
+    await admission_controller.aadmit(request_kwargs["max_tokens"])
+    client = get_async_openai_client()
+    response = await model_router.acomplete(client, "batch", **request_kwargs)
+    return parse_content_batch(response.choices[0].message.content, topic)
+
+
+@profiled()
+async def generate_seo_metrics(keyword):
+    """
+    Async version of ai_generator.generate_seo_metrics.
+    Returns a dict: {'search_volume': int, 'avg_cpc': float, 'keyword_difficulty': int}
+    """
+    async def create():
+        request_kwargs = build_seo_request(keyword)
+        await admission_controller.aadmit(request_kwargs["max_tokens"])
+        client = get_async_openai_client()
+        response = await model_router.acomplete(client, "seo", **request_kwargs)
+        return parse_seo_metrics(response.choices[0].message.content, keyword)
+
+    return await async_cache.get_or_create(f"seo:{keyword}", create, timeout=CACHE_TIMEOUT)
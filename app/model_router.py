@@ -0,0 +1,211 @@
+import os
+import time
+import logging
+from collections import deque
+from threading import Lock
+from dotenv import load_dotenv
+from openai import (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+    NotFoundError,
+    PermissionDeniedError,
+)
+from app.profiler import span
+
+logger = logging.getLogger(__name__)
+
+# Short stages go to the fastest, cheapest model so the main model's quota is
+# left for long posts. Each route is tried in order; later entries are failovers.
+DEFAULT_ROUTES = {
+    "title": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "seo": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "post": ["gpt-3.5-turbo", "gpt-4o-mini"],
+    "batch": ["gpt-3.5-turbo", "gpt-4o-mini"],
+}
+
+# Average latency (seconds) above which a model is considered slow for a stage
+DEFAULT_LATENCY_BUDGETS = {
+    "title": 5.0,
+    "seo": 5.0,
+    "post": 30.0,
+    "batch": 20.0,
+}
+
+# Errors that say "this model is unavailable (right now, or to this account)" rather than "the request is bad"
+FAILOVER_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+    NotFoundError,
+    PermissionDeniedError,
+)
+# Failures that take a model out of rotation for cooldown_seconds rather than just counting as errors
+COOLDOWN_ERRORS = (RateLimitError, NotFoundError, PermissionDeniedError)
+# Per-call timeout is this multiple of the stage's latency budget: loose enough that a
+# slow-but-answering model shows up in the average and gets demoted, tight enough that a
+# hung one fails over instead of blocking the request
+TIMEOUT_BUDGET_MULTIPLIER = 3
+# Timeout for stages without a latency budget
+DEFAULT_TIMEOUT = 60.0
+# SDK retries (which back off and honor Retry-After) kept for the last model in a route,
+# so a request still recovers when every model is rate-limited
+LAST_CANDIDATE_MAX_RETRIES = 2
+
+
+def load_routes():
+    """
+    Build the route table from DEFAULT_ROUTES, letting MODEL_ROUTE_<STAGE>
+    environment variables override a stage, e.g. MODEL_ROUTE_POST="gpt-4o,gpt-3.5-turbo".
+    """
+    load_dotenv()
+    routes = {stage: list(models) for stage, models in DEFAULT_ROUTES.items()}
+    for stage in routes:
+        override = os.getenv(f"MODEL_ROUTE_{stage.upper()}")
+        if override:
+            models = [m.strip() for m in override.split(",") if m.strip()]
+            if models:
+                routes[stage] = models
+    return routes
+
+
+class ModelStats:
+    """Rolling latency and error samples for a single model."""
+
+    def __init__(self, window_size=20):
+        self.samples = deque(maxlen=window_size)  # (timestamp, latency, is_error)
+        self.cooldown_until = 0
+
+    def recent(self, window_seconds):
+        cutoff = time.time() - window_seconds
+        return [s for s in self.samples if s[0] >= cutoff]
+
+
+class ModelRouter:
+    def __init__(self, routes, latency_budgets=None, window_size=20, window_seconds=300,
+                 max_error_rate=0.5, cooldown_seconds=60):
+        self.routes = routes
+        self.latency_budgets = latency_budgets or {}
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.max_error_rate = max_error_rate
+        self.cooldown_seconds = cooldown_seconds
+        self.stats = {}
+        self.lock = Lock()
+
+    def _stats_for(self, model):
+        if model not in self.stats:
+            self.stats[model] = ModelStats(self.window_size)
+        return self.stats[model]
+
+    def _is_healthy(self, model, stage):
+        stats = self._stats_for(model)
+        if time.time() < stats.cooldown_until:
+            return False
+        samples = stats.recent(self.window_seconds)
+        if not samples:
+            return True
+        error_rate = sum(1 for s in samples if s[2]) / len(samples)
+        if error_rate > self.max_error_rate:
+            return False
+        latencies = [s[1] for s in samples if not s[2]]
+        budget = self.latency_budgets.get(stage)
+        if budget and latencies and sum(latencies) / len(latencies) > budget:
+            return False
+        return True
+
+    def candidates(self, stage):
+        """Models for a stage, healthy ones first, in route order."""
+        route = self.routes.get(stage) or self.routes["post"]
+        with self.lock:
+            healthy = [m for m in route if self._is_healthy(m, stage)]
+        # Unhealthy models are kept as a last resort rather than failing outright
+        return healthy + [m for m in route if m not in healthy]
+
+    def _client_for(self, client, stage, last):
+        # SDK retries are off so a 429 or timeout reaches the router straight away and it can fail over,
+        # except on the last candidate where there is nothing left to fail over to
+        budget = self.latency_budgets.get(stage)
+        timeout = budget * TIMEOUT_BUDGET_MULTIPLIER if budget else DEFAULT_TIMEOUT
+        return client.with_options(timeout=timeout, max_retries=LAST_CANDIDATE_MAX_RETRIES if last else 0)
+
+    def record_success(self, model, latency):
+        with self.lock:
+            self._stats_for(model).samples.append((time.time(), latency, False))
+
+    def record_error(self, model, latency, rate_limited=False):
+        with self.lock:
+            stats = self._stats_for(model)
+            stats.samples.append((time.time(), latency, True))
+            if rate_limited:
+                stats.cooldown_until = time.time() + self.cooldown_seconds
+
+    def complete(self, client, stage, **kwargs):
+        """
+        Run a chat completion for a stage, failing over to the next model in
+        the route when a model is rate-limited, times out, is unavailable or
+        the account has no access to it.
+        """
+        candidates = self.candidates(stage)
+        last_error = None
+        for i, model in enumerate(candidates):
+            model_client = self._client_for(client, stage, last=i == len(candidates) - 1)
+            start = time.time()
+            try:
+                with span(f"openai.{stage}:{model}"):
+                    response = model_client.chat.completions.create(model=model, **kwargs)
+            except FAILOVER_ERRORS as e:
+                latency = time.time() - start
+                self.record_error(model, latency, rate_limited=isinstance(e, COOLDOWN_ERRORS))
+                logger.warning(f"Model {model} failed for stage '{stage}' ({type(e).__name__}), trying next model")
+                last_error = e
+                continue
+            latency = time.time() - start
+            self.record_success(model, latency)
+            logger.info(f"Stage '{stage}' served by {model} in {latency:.2f}s")
+            return response
+        raise last_error
+
+    async def acomplete(self, client, stage, **kwargs):
+        """Async version of complete() for an AsyncOpenAI client. Shares the same model stats."""
+        candidates = self.candidates(stage)
+        last_error = None
+        for i, model in enumerate(candidates):
+            model_client = self._client_for(client, stage, last=i == len(candidates) - 1)
+            start = time.time()
+            try:
+                with span(f"openai.{stage}:{model}"):
+                    response = await model_client.chat.completions.create(model=model, **kwargs)
+            except FAILOVER_ERRORS as e:
+                latency = time.time() - start
+                self.record_error(model, latency, rate_limited=isinstance(e, COOLDOWN_ERRORS))
+                logger.warning(f"Model {model} failed for stage '{stage}' ({type(e).__name__}), trying next model")
+                last_error = e
+                continue
+            latency = time.time() - start
+            self.record_success(model, latency)
+            logger.info(f"Stage '{stage}' served by {model} in {latency:.2f}s")
+            return response
+        raise last_error
+
+    def snapshot(self):
+        """Per-model summary for the debug page."""
+        now = time.time()
+        summary = {}
+        with self.lock:
+            for model, stats in self.stats.items():
+                samples = stats.recent(self.window_seconds)
+                latencies = [s[1] for s in samples if not s[2]]
+                summary[model] = {
+                    "calls": len(samples),
+                    "error_rate": round(sum(1 for s in samples if s[2]) / len(samples), 2) if samples else 0.0,
+                    "avg_latency": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                    "cooling_down": now < stats.cooldown_until,
+                }
+        return summary
+
+
+# Create a global model router shared by all generation stages
+model_router = ModelRouter(load_routes(), latency_budgets=DEFAULT_LATENCY_BUDGETS)
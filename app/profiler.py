@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import functools
+import hmac
+import inspect
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from threading import Lock
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name, default):
+    # A bad value shouldn't stop the app from starting
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+
+# Send this header to trace a single request. Its value must match PROFILE_SECRET,
+# or the app must be running in debug mode, so clients can't probe internals.
+PROFILE_HEADER = "X-Profile"
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+# Fraction of requests traced without the header, e.g. 0.01 for 1%.
+# Sampled requests only feed the slow-request log; they don't get a Server-Timing header.
+PROFILE_SAMPLE_RATE = _env_float("PROFILE_SAMPLE_RATE", 0.0)
+# Traced requests slower than this (seconds) go to the slow-request log
+SLOW_REQUEST_THRESHOLD = _env_float("SLOW_REQUEST_THRESHOLD", 5.0)
+SLOW_REQUEST_LOG = os.getenv("SLOW_REQUEST_LOG", "slow_requests.log")
+MAX_SLOW_REQUESTS = 50
+
+# Dedicated file logger so slow requests don't get lost in the app log
+slow_logger = logging.getLogger("slow_requests")
+slow_logger.propagate = False
+if not slow_logger.handlers:
+    _handler = logging.FileHandler(SLOW_REQUEST_LOG, encoding="utf-8", delay=True)
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_logger.addHandler(_handler)
+    slow_logger.setLevel(logging.INFO)
+
+# Most recent slow requests, kept for /debug/profile
+_slow_requests = deque(maxlen=MAX_SLOW_REQUESTS)
+_slow_lock = Lock()
+
+
+class _Trace:
+    def __init__(self, expose):
+        self.expose = expose  # whether the client may see the spans in a Server-Timing header
+        self.spans = []
+        self.start = time.perf_counter()
+
+
+# Kept in contextvars rather than Flask's g so the same spans work in the Flask app,
+# the Quart app, and the asyncio tasks and worker threads they start
+_current_trace = ContextVar("profile_trace", default=None)
+_current_depth = ContextVar("profile_depth", default=0)
+
+
+def is_profiling():
+    return _current_trace.get() is not None
+
+
+@contextmanager
+def span(name):
+    """Time a block as a span of the current request's trace. No-op when not profiling."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    depth = _current_depth.get()
+    token = _current_depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_depth.reset(token)
+        trace.spans.append({
+            "name": name,
+            "start": round(start - trace.start, 4),
+            "duration": round(time.perf_counter() - start, 4),
+            "depth": depth,
+        })
+
+
+def profiled(name=None):
+    """Decorator form of span(), named after the function by default. Works on sync and async functions."""
+    def decorator(func):
+        span_name = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _header_authorized(value, debug):
+    if not value:
+        return False
+    if debug:
+        return True
+    return bool(PROFILE_SECRET) and hmac.compare_digest(value, PROFILE_SECRET)
+
+
+def start_request(header_value, debug=False):
+    """Start a trace for the current request if it asked for one or is sampled."""
+    authorized = _header_authorized(header_value, debug)
+    if authorized or random.random() < PROFILE_SAMPLE_RATE:
+        _current_trace.set(_Trace(authorized))
+
+
+def finish_request(method, path, status, headers):
+    """End the current trace, adding Server-Timing to `headers` and logging it if slow."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    _current_trace.set(None)
+    total = time.perf_counter() - trace.start
+    spans = sorted(trace.spans, key=lambda s: (s["start"], s["depth"]))
+    if trace.expose:
+        headers["Server-Timing"] = ", ".join(
+            [f'span{i};desc="{s["name"]}";dur={s["duration"] * 1000:.1f}' for i, s in enumerate(spans)]
+            + [f"total;dur={total * 1000:.1f}"]
+        )
+    if total >= SLOW_REQUEST_THRESHOLD:
+        record_slow_request({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "method": method,
+            "path": path.rstrip("?"),
+            "status": status,
+            "total": round(total, 4),
+            "spans": spans,
+        })
+
+
+def clear_request(exc=None):
+    # Drop a trace left behind by a request that raised before finish_request ran
+    _current_trace.set(None)
+
+
+def record_slow_request(entry):
+    breakdown = "; ".join(f"{'  ' * s['depth']}{s['name']}={s['duration']:.3f}s" for s in entry["spans"])
+    slow_logger.info(f"{entry['method']} {entry['path']} {entry['status']} took {entry['total']:.3f}s: {breakdown}")
+    with _slow_lock:
+        _slow_requests.append(entry)
+
+
+def get_slow_requests():
+    """Recent slow requests, slowest first."""
+    with _slow_lock:
+        return sorted(_slow_requests, key=lambda e: e["total"], reverse=True)
+
+
+def init_app(app):
+    """Register tracing hooks on the Flask app."""
+    from flask import request
+
+    @app.before_request
+    def _start():
+        start_request(request.headers.get(PROFILE_HEADER), app.debug)
+
+    @app.after_request
+    def _finish(response):
+        finish_request(request.method, request.full_path, response.status_code, response.headers)
+        return response
+
+    app.teardown_request(clear_request)
+
+
+def init_quart_app(app):
+    """Register tracing hooks on the Quart (ASGI) app."""
+    from quart import request
+
+    @app.before_request
+    async def _start():
+        start_request(request.headers.get(PROFILE_HEADER), app.debug)
+
+    @app.after_request
+    async def _finish(response):
+        finish_request(request.method, request.full_path, response.status_code, response.headers)
+        return response
+
+    @app.teardown_request
+    async def _clear(exc=None):
+        clear_request(exc)
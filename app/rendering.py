@@ -0,0 +1,96 @@
+# Page template and blog HTML helpers shared by the Flask app (app.py) and the ASGI app (asgi_app.py).
+# Keep this module free of side effects: importing app.py starts the scheduler.
+import os
+import re
+from datetime import datetime
+from markupsafe import escape
+from app import profiler
+
+# Base HTML template for consistent styling
+BASE_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>{{ title }}</title>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto; padding: 20px; }
+        h1 { color: #333; }
+        .metrics { background: #f5f5f5; padding: 15px; border-radius: 5px; margin-top: 20px; }
+        .error { color: red; }
+        nav { margin-bottom: 20px; }
+        nav a { margin-right: 15px; }
+        .affiliate { margin-top: 30px; background: #e8f4fd; padding: 15px; border-radius: 5px; }
+    </style>
+</head>
+<body>
+    <nav>
+        <a href="/">Home</a>
+        <a href="/about">About</a>
+        <a href="/generate?keyword=AI">Generate Blog</a>
+    </nav>
+    <div class="content">
+        {{ content | safe }}
+    </div>
+</body>
+</html>
+"""
+
+def safe_filename(keyword):
+    # Only allow alphanumeric, dash, and underscore
+    return re.sub(r'[^a-zA-Z0-9_-]', '_', keyword)
+
+def blog_content_html(title, content, metrics=None):
+    # Add affiliate links at the bottom
+    affiliate_html = """
+    <div class="affiliate">
+        <h2>Recommended Products</h2>
+        <ul>
+            <li><a href="https://affiliate.example.com/product1" target="_blank">Product 1</a></li>
+            <li><a href="https://affiliate.example.com/product2" target="_blank">Product 2</a></li>
+            <li><a href="https://affiliate.example.com/product3" target="_blank">Product 3</a></li>
+        </ul>
+    </div>
+    """
+    metrics_html = ""
+    if metrics:
+        metrics_html = f"""
+        <div class="metrics">
+            <h2>SEO Metrics</h2>
+            <p>Search Volume: {metrics.get('search_volume')}</p>
+            <p>Avg CPC: ${metrics.get('avg_cpc')}</p>
+            <p>Keyword Difficulty: {metrics.get('keyword_difficulty')}/100</p>
+        </div>
+        """
+    return f"<h1>{title}</h1><p>{content}</p>{metrics_html}{affiliate_html}"
+
+@profiler.profiled("save")
+def save_blog_html(html_output, topic, mode="manual"):
+    safe_name = safe_filename(topic)
+    save_dir = os.path.join("saved_blogs", mode)
+    os.makedirs(save_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(save_dir, f"blog_{mode}_{safe_name}_{timestamp}.html")
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(html_output)
+    print(f"Blog saved to {filename}")
+    return filename
+
+def slow_requests_html():
+    # Body of the /debug/profile page, shared by both apps
+    rows = []
+    for entry in profiler.get_slow_requests():
+        spans = ''.join([
+            f"<li style='margin-left: {s['depth'] * 20}px'>{s['name']}: {s['duration']:.3f}s (at +{s['start']:.3f}s)</li>"
+            for s in entry['spans']
+        ])
+        rows.append(f"""
+            <h3>{entry['method']} {escape(entry['path'])} - {entry['total']:.3f}s</h3>
+            <p>{entry['time']} - status {entry['status']}</p>
+            <ul>{spans}</ul>
+        """)
+    return f"""
+        <h1>Slow Requests</h1>
+        <p>Send an <code>{profiler.PROFILE_HEADER}</code> header set to <code>PROFILE_SECRET</code> (any value in debug mode) to trace a request.
+        Sample rate: {profiler.PROFILE_SAMPLE_RATE}, slow threshold: {profiler.SLOW_REQUEST_THRESHOLD}s.</p>
+        {''.join(rows) or '<p>No slow requests recorded yet.</p>'}
+    """
@@ -0,0 +1,32 @@
+# Settings for the daily scheduled post, shared by the Flask app (app.py) and the ASGI app (asgi_app.py)
+import os
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PREDEFINED_KEYWORDS = [
+    "wireless earbuds",
+    "smart home devices",
+    "AI in healthcare",
+    "electric vehicles",
+    "blockchain technology",
+    "remote work tools",
+    "fitness trackers",
+    "sustainable fashion",
+    "cloud computing",
+    "virtual reality"
+]
+
+# How long to push back a scheduled run when interactive traffic has the OpenAI budget
+SCHEDULED_JOB_DEFER_MINUTES = 15
+
+# Which server process runs the scheduled post: "flask" (run.py) or "asgi" (asgi.py).
+# Admission budgets are per process, so run it in the process that serves your
+# interactive traffic if you want it to give way to that traffic.
+SCHEDULER_PROCESS = os.getenv("SCHEDULER_PROCESS", "flask").lower()
+if SCHEDULER_PROCESS not in ("flask", "asgi"):
+    logger.warning(f"Ignoring invalid SCHEDULER_PROCESS={SCHEDULER_PROCESS!r}, using 'flask'")
+    SCHEDULER_PROCESS = "flask"
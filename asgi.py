@@ -0,0 +1,10 @@
+# asgi.py
+# Async entry point for the generation routes (/api/generate, /generate, /api/seo)
+# Use it when you need many generations in flight at once
+# The daily scheduled post runs here instead of run.py when SCHEDULER_PROCESS=asgi
+# The command to run it is: hypercorn asgi:asgi_app
+
+from app.asgi_app import asgi_app
+
+if __name__ == '__main__':
+    asgi_app.run()
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected, priority
+
+# A short interval between calls keeps the timing-based tests fast
+CALLS_PER_MINUTE = 60  # one call per second
+CLASSES = {
+    "interactive": {"weight": 6, "slo": None},
+    "api": {"weight": 3, "slo": 1.5},
+    "background": {"weight": 1, "slo": 30},
+}
+
+
+def make_controller(calls_per_minute=CALLS_PER_MINUTE):
+    return AdmissionController(calls_per_minute=calls_per_minute, tokens_per_minute=100000, classes=CLASSES)
+
+
+def start_admit(controller, priority_class, label, order, errors=None):
+    def run():
+        try:
+            controller.admit(100, priority_class)
+            order.append(label)
+        except AdmissionRejected as e:
+            if errors is None:
+                raise
+            errors.append((label, e))
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_interactive_overtakes_queued_background():
+    controller = make_controller(calls_per_minute=600)
+    order = []
+    threads = []
+    for i in range(4):
+        threads.append(start_admit(controller, "background", f"b{i}", order))
+        time.sleep(0.02)
+    threads.append(start_admit(controller, "interactive", "i0", order))
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # b0 took the free slot straight away; the interactive call goes before the queued background ones
+    assert order[:2] == ["b0", "i0"]
+    assert sorted(order[2:]) == ["b1", "b2", "b3"]
+
+
+def test_rejected_at_enqueue_when_estimate_exceeds_slo():
+    controller = make_controller()
+    controller.admit(100, "api")  # takes the slot; the next call must wait ~1s
+    # Two queued interactive calls go first, so a new api call would wait ~3s
+    interactive = [start_admit(controller, "interactive", f"i{i}", []) for i in range(2)]
+    time.sleep(0.05)
+
+    start = time.time()
+    with pytest.raises(AdmissionRejected):
+        controller.admit(100, "api")
+    assert time.time() - start < 0.5  # rejected up front, not after waiting
+    assert controller.stats()["api"]["rejected"] == 1
+    for thread in interactive:
+        thread.join(timeout=5)
+
+
+def test_rejected_while_waiting_when_overtaken():
+    controller = make_controller()
+    controller.admit(100, "api")  # the next slot opens in ~1s
+    order, errors = [], []
+    waiting = start_admit(controller, "api", "a1", order, errors)  # estimate ~1s, within the 1.5s SLO
+    time.sleep(0.05)
+    # Interactive arrivals take the next slots, pushing a1 past its SLO
+    interactive = [start_admit(controller, "interactive", f"i{i}", order) for i in range(2)]
+    waiting.join(timeout=5)
+
+    assert [label for label, _ in errors] == ["a1"]
+    stats = controller.stats()
+    assert stats["api"]["rejected"] == 1
+    assert stats["api"]["queue_depth"] == 0
+    for thread in interactive:
+        thread.join(timeout=5)
+
+
+def test_request_budget_checked_once_and_never_rejected_midway():
+    controller = make_controller()
+    with priority("api"), controller.request([100, 100]):
+        controller.admit(100)  # whole request estimated at ~1s, within SLO
+        # Interactive traffic now takes the next slot, so the second call waits ~2s, past the SLO
+        interactive = start_admit(controller, "interactive", "i0", [])
+        time.sleep(0.05)
+        controller.admit(100)
+    interactive.join(timeout=5)
+    assert controller.stats()["api"]["admitted"] == 2
+    assert controller.stats()["api"]["rejected"] == 0
+
+
+def test_request_budget_rejected_before_first_call():
+    controller = make_controller()
+    with priority("api"), controller.request([100] * 5):
+        # Five sequential calls need ~4s of slots, past the 1.5s SLO
+        with pytest.raises(AdmissionRejected):
+            controller.admit(100)
+        # Later calls of the same request get the same answer without queueing
+        with pytest.raises(AdmissionRejected):
+            controller.admit(100)
+    stats = controller.stats()["api"]
+    assert stats["admitted"] == 0
+    assert stats["rejected"] == 1
+
+
+def test_aadmit_cancellation_removes_ticket():
+    controller = make_controller()
+
+    async def main():
+        await controller.aadmit(100, "background")  # takes the slot
+        waiter = asyncio.ensure_future(controller.aadmit(100, "background"))
+        await asyncio.sleep(0.05)
+        assert controller.stats()["background"]["queue_depth"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.stats()["background"]["queue_depth"] == 0
+        # The queue still works after the cancellation
+        await asyncio.wait_for(controller.aadmit(100, "interactive"), timeout=3)
+
+    asyncio.run(main())
+    assert controller.stats()["background"]["admitted"] == 1
+    assert controller.stats()["interactive"]["admitted"] == 1
+
+
+def test_async_interactive_overtakes_sync_background():
+    controller = make_controller(calls_per_minute=600)
+    order = []
+    threads = []
+    for i in range(3):
+        threads.append(start_admit(controller, "background", f"b{i}", order))
+        time.sleep(0.02)
+
+    async def interactive():
+        await controller.aadmit(100, "interactive")
+        order.append("i0")
+
+    asyncio.run(interactive())
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order[:2] == ["b0", "i0"]